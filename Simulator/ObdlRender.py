@@ -7,10 +7,120 @@ from pyRBDL.Kinematics.TransformToPosition import TransformToPosition
 import time
 import math
 import os
+import jax
 import jax.numpy as jnp
 from Simulator.UrdfReader import URDF
 from Simulator.UrdfWrapper import UrdfWrapper
 
+try:
+    from numba import njit
+except ImportError:
+    #numba is optional; fall back to the plain python loop
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        def wrap(func):
+            return func
+        return wrap
+
+
+@njit(cache=True)
+def _transform_rpy_core(q, axis_idx, axis_sign, active, parent_idx, NL):
+    """
+    accumulate joint rpys down the parent chain; plain numeric loop
+    over int/float arrays so numba can compile it when available
+    """
+    j_rpys = np.zeros((NL,3))
+    for i in range(NL):
+        _pid = parent_idx[i]
+        for k in range(3):
+            j_rpys[i,k] = j_rpys[_pid,k]
+        if active[i]:
+            _ax = axis_idx[i]
+            if i == 0:
+                j_rpys[0,_ax] = axis_sign[0]*q[0]
+            else:
+                j_rpys[i,_ax] = j_rpys[_pid,_ax] + axis_sign[i]*q[i]
+    return j_rpys
+
+
+def eulers_to_quats(rpys):
+    """
+    vectorized rpy -> (x,y,z,w) quaternion for a whole (N,3) array,
+    one numpy call instead of N getQuaternionFromEuler round-trips
+    """
+    c = np.cos(rpys * 0.5)
+    s = np.sin(rpys * 0.5)
+    cr, cp, cy = c[:,0], c[:,1], c[:,2]
+    sr, sp, sy = s[:,0], s[:,1], s[:,2]
+    qx = sr*cp*cy - cr*sp*sy
+    qy = cr*sp*cy + sr*cp*sy
+    qz = cr*cp*sy - sr*sp*cy
+    qw = cr*cp*cy + sr*sp*sy
+    return np.stack([qx,qy,qz,qw],axis=1)
+
+
+def quat_mul(q1,q2):
+    """
+    hamilton product of (x,y,z,w) quaternions, same composition as
+    p.multiplyTransforms on pure rotations
+    """
+    x1,y1,z1,w1 = q1
+    x2,y2,z2,w2 = q2
+    return np.array([
+        w1*x2 + x1*w2 + y1*z2 - z1*y2,
+        w1*y2 - x1*z2 + y1*w2 + z1*x2,
+        w1*z2 + x1*y2 - y1*x2 + z1*w2,
+        w1*w2 - x1*x2 - y1*y2 - z1*z2,
+    ])
+
+
+def _skew_np(v):
+    return np.array([[0.0,-v[2],v[1]],
+                     [v[2],0.0,-v[0]],
+                     [-v[1],v[0],0.0]])
+
+
+def _calc_body_to_base_np(model,q,body_id,point_pos,axis_idx,axis_sign):
+    """
+    numpy mirror of pyRBDL CalcBodyToBaseCoordinates for rendering:
+    no gradients are needed per frame, so plain numpy avoids the
+    XLA dispatch and the device->host copy of every position
+    """
+    parent = model['parent']
+    jtype = model['jtype']
+    Xtree = model['Xtree']
+    X0 = [None]*body_id
+    for i in range(body_id):
+        qi = axis_sign[i]*q[i]
+        _ax = axis_idx[i]
+        if(jtype[i] == 0):
+            #revolute: Featherstone rotation transform about the joint axis
+            c,s = np.cos(qi),np.sin(qi)
+            if(_ax == 0):
+                E = np.array([[1.0,0.0,0.0],[0.0,c,s],[0.0,-s,c]])
+            elif(_ax == 1):
+                E = np.array([[c,0.0,-s],[0.0,1.0,0.0],[s,0.0,c]])
+            else:
+                E = np.array([[c,s,0.0],[-s,c,0.0],[0.0,0.0,1.0]])
+            XJ = np.zeros((6,6))
+            XJ[:3,:3] = E
+            XJ[3:,3:] = E
+        else:
+            #prismatic: translation transform along the joint axis
+            d = np.zeros((3,))
+            d[_ax] = qi
+            XJ = np.eye(6)
+            XJ[3:,:3] = -_skew_np(d)
+        Xup = XJ @ np.asarray(Xtree[i])
+        _pid = parent[i]
+        X0[i] = Xup if(_pid == 0) else Xup @ X0[_pid-1]
+    X = X0[body_id-1]
+    E0 = X[:3,:3]
+    rx = -E0.T @ X[3:6,:3]
+    r = np.array([rx[2,1],rx[0,2],rx[1,0]])
+    return r + E0.T @ np.asarray(point_pos)
+
 
 class RenderObject():
     def __init__(self):
@@ -60,9 +170,23 @@ class RenderObject():
 class ObdlRender():
     def __init__(self,model):
         self.urdf_path = model["urdf_path"]
-        self.robot= URDF.load(model["urdf_path"]) 
+        self.robot= URDF.load(model["urdf_path"])
         self.model=model
-        self.p = p 
+        self.p = p
+
+        #precompute joint tables once so the per-frame loops do
+        #integer/float array ops instead of dict lookups and string compares
+        _axis_table = {'x':0,'y':1,'z':2,'a':0,'b':1,'c':2}
+        self._axis_idx = np.array([_axis_table[_ax] for _ax in model['jaxis']])
+        self._axis_sign = np.array([1.0 if _ax in 'xyz' else -1.0 for _ax in model['jaxis']])
+        self._active_mask = np.asarray(model['jtype']) == 0
+        self._parent_idx = np.array(model['parent']) - 1
+
+        #jitted forward kinematics specialized per body id, filled lazily
+        self._fk_cache = dict()
+        #the renderer never differentiates through the kinematics, so
+        #default to the numpy path; set False to go through pyRBDL/jax
+        self.render_only = True
 
         #launch pybullet
         p.connect(p.GUI)
@@ -73,10 +197,28 @@ class ObdlRender():
         #get mapping from model
         self.id_mapping = dict()
 
+        #identical geometries share one vis/collision shape pair
+        self._shape_cache = dict()
+
         #render
         self.get_objects(self.robot)
         self.create_objects()
 
+        #hoist per-object attributes into arrays once, so step_render
+        #indexes these instead of doing attribute lookups per object per frame
+        self._origins = np.stack([np.asarray(_o.origin).flatten() for _o in self.render_objects])
+        self._parent_jids = np.array([_o.parent_joint + 1 for _o in self.render_objects])
+        self._body_ids = np.array([_o.body_id for _o in self.render_objects])
+        #pose state lives in contiguous SoA slabs, not on the objects
+        self.positions = np.stack([np.asarray(_o.position).flatten() for _o in self.render_objects])
+        self.quats = np.stack([np.asarray(_o.quat).flatten() for _o in self.render_objects])
+
+        #preallocated per-frame buffers, zeroed in place each step so
+        #rendering doesn't reallocate (and GC) small arrays every frame
+        self._active_rows = np.nonzero(self._active_mask[:self.NL])[0]
+        self._local_rpys_buf = np.zeros((self.NL,3))
+        self._j_qua_buf = np.zeros((self.NL,4))
+
     def create_objects(self):
 
         return
@@ -169,18 +311,33 @@ class ObdlRender():
     def create_visualshape(self,target_obj):
         body_id = -1
         vis_id = -1
-        if(target_obj.type == "box"):
-            vis_id = p.createVisualShape(p.GEOM_BOX, halfExtents=target_obj.shape,rgbaColor=target_obj.rgba,visualFrameOrientation=target_obj.init_qua)
-            col_id = p.createCollisionShape(p.GEOM_BOX, halfExtents=target_obj.shape)
-        elif(target_obj.type == "cylinder"):
-            vis_id = p.createVisualShape(p.GEOM_CYLINDER, radius=target_obj.shape[0],length=target_obj.shape[1], rgbaColor=target_obj.rgba,visualFrameOrientation=target_obj.init_qua)
-            col_id = p.createCollisionShape(p.GEOM_CYLINDER, radius=target_obj.shape[0],length=target_obj.shape[1])
-        elif(target_obj.type == "sphere"):
-            vis_id = p.createVisualShape(p.GEOM_SPHERE, radius=target_obj.shape[0],rgbaColor=target_obj.rgba,visualFrameOrientation=target_obj.init_qua)
-            col_id = p.createCollisionShape(p.GEOM_SPHERE, radius=target_obj.shape[0])
-        elif(target_obj.type == "mesh"):
-            vis_id = p.createVisualShape(p.GEOM_MESH, fileName=target_obj.shape[0],meshScale=target_obj.scale,visualFrameOrientation=target_obj.init_qua)
-            col_id = p.createCollisionShape(p.GEOM_MESH, fileName=target_obj.shape[0],meshScale=target_obj.scale)
+        #reuse shape ids across identical geometries: mesh loading
+        #dominates urdf init cost, so cache by geometry key
+        if(target_obj.type == "mesh"):
+            #urdf <mesh> tags without a scale attribute give scale=None,
+            #which pybullet treats as the default; normalize so those
+            #dedupe with an explicit scale="1 1 1"
+            _scale = tuple(target_obj.scale) if target_obj.scale is not None else (1.0,1.0,1.0)
+            _key = ("mesh",target_obj.shape[0],_scale,tuple(target_obj.init_qua))
+        else:
+            _key = (target_obj.type,tuple(np.asarray(target_obj.shape).flatten()),
+                    tuple(np.asarray(target_obj.rgba).flatten()),tuple(target_obj.init_qua))
+        if(_key in self._shape_cache):
+            vis_id,col_id = self._shape_cache[_key]
+        else:
+            if(target_obj.type == "box"):
+                vis_id = p.createVisualShape(p.GEOM_BOX, halfExtents=target_obj.shape,rgbaColor=target_obj.rgba,visualFrameOrientation=target_obj.init_qua)
+                col_id = p.createCollisionShape(p.GEOM_BOX, halfExtents=target_obj.shape)
+            elif(target_obj.type == "cylinder"):
+                vis_id = p.createVisualShape(p.GEOM_CYLINDER, radius=target_obj.shape[0],length=target_obj.shape[1], rgbaColor=target_obj.rgba,visualFrameOrientation=target_obj.init_qua)
+                col_id = p.createCollisionShape(p.GEOM_CYLINDER, radius=target_obj.shape[0],length=target_obj.shape[1])
+            elif(target_obj.type == "sphere"):
+                vis_id = p.createVisualShape(p.GEOM_SPHERE, radius=target_obj.shape[0],rgbaColor=target_obj.rgba,visualFrameOrientation=target_obj.init_qua)
+                col_id = p.createCollisionShape(p.GEOM_SPHERE, radius=target_obj.shape[0])
+            elif(target_obj.type == "mesh"):
+                vis_id = p.createVisualShape(p.GEOM_MESH, fileName=target_obj.shape[0],meshScale=_scale,visualFrameOrientation=target_obj.init_qua)
+                col_id = p.createCollisionShape(p.GEOM_MESH, fileName=target_obj.shape[0],meshScale=_scale)
+            self._shape_cache[_key] = (vis_id,col_id)
         body_id = p.createMultiBody(baseMass=0.01,  baseCollisionShapeIndex = col_id, baseVisualShapeIndex=vis_id, basePosition =target_obj.position,\
                                     baseOrientation = target_obj.quat)
         # body_id = p.createMultiBody(baseMass=0.01,  baseVisualShapeIndex=vis_id, basePosition =target_obj.position,baseOrientation = target_obj.quat)
@@ -190,59 +347,32 @@ class ObdlRender():
         """
         render robot to the target joint angle
         """
-        self.rpys = np.zeros((3,))
         # self.transform_rpy(self.model,targetQ)
         self.transform_qua(self.model,targetQ)
-        n_obj = len(self.render_objects)
+        q = np.asarray(targetQ)
+        n_obj = len(self._body_ids)
         for i in range(n_obj):
-            if(self.render_objects[i].parent_joint == 0):
+            if(self._parent_jids[i] == 1):
                 continue #TODO need discuss
-            pos,qua = self.transform_pos(self.model,self.render_objects[i],targetQ)
-            self.render_objects[i].assign_pose(pos,qua)
-        
-        for _obj in self.render_objects:
-            self.move_obj(_obj)
+            pos = self._fk(self._parent_jids[i], q, self._origins[i])
+            self.positions[i] = np.asarray(pos).flatten()
+            self.quats[i] = self.quas[self._parent_jids[i] - 1]
+
+        #pybullet has no batched pose setter, so only this tight loop remains
+        for i in range(n_obj):
+            p.resetBasePositionAndOrientation(self._body_ids[i], self.positions[i], self.quats[i])
         return
 
     def transform_rpy(self,model,q):
         """
         transform the q to all rpy
         """
-        self.rpys = np.zeros((self.NL,3))
-        self.j_rpys = np.zeros((self.NL,3))
-        self.counted = np.zeros((self.NL,))
-        parent = np.array(self.model['parent'])
-        # print(parent)
-        #calc joint rpy
-        for i in range(self.NL):
-            _rpy = np.zeros((3,))
-            _pid = parent[i] -1 
-            _rpy = np.array(self.j_rpys[_pid])
-            if(i == 0):
-                if(model['jtype'][0] == 0):
-                    if(model['jaxis'][0]=='x'):
-                        _rpy[0] = q[0]
-                    elif(model['jaxis'][0]=='y'):
-                        _rpy[1] =  q[0]
-                    elif(model['jaxis'][0]=='z'):
-                        _rpy[2] =  q[0]
-            else:
-                if(model['jtype'][i] == 0):
-                    if(model['jaxis'][i]=='x'):
-                        _rpy[0] = self.j_rpys[_pid][0] + q[i]
-                    elif(model['jaxis'][i]=='y'):
-                        _rpy[1] = self.j_rpys[_pid][1] + q[i]
-                    elif(model['jaxis'][i]=='z'):
-                        _rpy[2] = self.j_rpys[_pid][2] + q[i]
-                    elif(model['jaxis'][i]=='a'):
-                        _rpy[0] = self.j_rpys[_pid][0] - q[i]
-                    elif(model['jaxis'][i]=='b'):
-                        _rpy[1] = self.j_rpys[_pid][1] - q[i]
-                    elif(model['jaxis'][i]=='c'):
-                        _rpy[2] = self.j_rpys[_pid][2] - q[i]
-                # print("link",i,"parent",_pid,"angle",_rpy)
-            self.j_rpys[i] = _rpy
-        
+        #calc joint rpy, parents come in topological order so one pass
+        #with the precomputed axis index/sign tables suffices
+        self.j_rpys = _transform_rpy_core(np.asarray(q,dtype=np.float64),
+                                          self._axis_idx, self._axis_sign,
+                                          self._active_mask, self._parent_idx, self.NL)
+
         #calc link's rpy, which is qeqaul to parent joint rpy 
         self.rpys = self.j_rpys
         # print("type",model['jtype'],"current_q",q,"rpys",self.rpys)
@@ -252,54 +382,52 @@ class ObdlRender():
         """
         transform the q to all rpy
         """
-        zeros_pos = np.zeros((3,))
-        self.quas = np.zeros((self.NL,4))
-        self.quas[:,-1] = 1.0
-        self.j_qua = np.zeros((self.NL,4))
+        q = np.asarray(q)
+        #local joint rpy for all links in one shot via the axis tables,
+        #written into the preallocated buffer
+        local_rpys = self._local_rpys_buf
+        local_rpys[:] = 0.0
+        _active = self._active_rows
+        local_rpys[_active, self._axis_idx[_active]] = self._axis_sign[_active] * q[_active]
+        #all local quaternions with one vectorized numpy call,
+        #no per-link python<->C crossing into pybullet
+        local_quas = eulers_to_quats(local_rpys)
+
+        self.j_qua = self._j_qua_buf
+        self.j_qua[:] = 0.0
         self.j_qua[:,-1] = 1.0
-        parent = np.array(self.model['parent'])
-        # print(parent)
-        #calc joint rpy
+        #compose down the chain, parents come first
         for i in range(self.NL):
-            _pid = parent[i] -1 
-            _qua = np.array([0.0,0.0,0.0,1.0])
-            _rpy = np.array([0.0,0.0,0.0])
+            _pid = self._parent_idx[i]
             if(i == 0):
-                if(model['jtype'][0] == 0):
-                    if(model['jaxis'][0]=='x'):
-                        _rpy = [q[0],0.0,0.0]
-                        _qua = self.p.getQuaternionFromEuler (_rpy)
-                    elif(model['jaxis'][0]=='y'):
-                        _rpy = [0.0,q[0],0.0]
-                        _qua = self.p.getQuaternionFromEuler (_rpy)
-                    elif(model['jaxis'][0]=='z'):
-                        _rpy = [0.0,0.0,q[0]]
-                        _qua = self.p.getQuaternionFromEuler (_rpy)
+                if(self._active_mask[0]):
+                    self.j_qua[0] = local_quas[0]
             else:
-                if(model['jtype'][i] == 0):
-                    if(model['jaxis'][i]=='x'):
-                        _rpy = [q[i],0.0,0.0]
-                    elif(model['jaxis'][i]=='y'):
-                        _rpy = [0.0,q[i],0.0]
-                    elif(model['jaxis'][i]=='z'):
-                        _rpy = [0.0,0.0,q[i]]
-                    elif(model['jaxis'][i]=='a'):
-                        _rpy = [-q[i],0.0,0.0]
-                    elif(model['jaxis'][i]=='b'):
-                        _rpy = [0.0,-q[i],0.0]
-                    elif(model['jaxis'][i]=='c'):
-                        _rpy = [0.0,0.0,-q[i]]
-                _qua = self.p.getQuaternionFromEuler (_rpy)
-                _pQua = np.array(self.j_qua[_pid])
-                _qua = self.p.multiplyTransforms(zeros_pos,_pQua,zeros_pos,_qua)[1]
-            # print("link",i,"parent",_pid,"qua:",_qua)
-            self.j_qua[i] = _qua
+                self.j_qua[i] = quat_mul(self.j_qua[_pid], local_quas[i])
+            # print("link",i,"parent",_pid,"qua:",self.j_qua[i])
         #calc link's rpy, which is qeqaul to parent joint rpy
-        # print(self.j_qua) 
+        # print(self.j_qua)
         self.quas = self.j_qua
         return
 
 
+    def _fk(self,jid,q,local_pos):
+        """
+        CalcBodyToBaseCoordinates jitted per body id; the model dict and
+        the structural id are closed over, so each body traces once and
+        every later frame hits the cached XLA executable instead of
+        re-dispatching through the interpreter
+        """
+        _key = int(jid)
+        if(self.render_only):
+            return _calc_body_to_base_np(self.model,np.asarray(q),_key,local_pos,
+                                         self._axis_idx,self._axis_sign)
+        if(_key not in self._fk_cache):
+            _model = self.model
+            self._fk_cache[_key] = jax.jit(
+                lambda _q,_lp,_jid=_key: CalcBodyToBaseCoordinates(_model,_q,_jid,_lp))
+        return self._fk_cache[_key](q,local_pos)
+
     def move_obj(self,_obj):
         # p.resetBasePositionAndOrientation(_obj.body_id,_obj.position,(0.0,0.0,0.0,1.0))
         p.resetBasePositionAndOrientation(_obj.body_id,_obj.position,_obj.quat)
@@ -313,11 +441,10 @@ class ObdlRender():
         pos,qua = None,None
         q = np.asarray(q)
 
-        local_pos = np.asarray(obj.origin).flatten() 
+        local_pos = np.asarray(obj.origin).flatten()
         _jid = obj.parent_joint +1 #TODO need discuss
-        input = (model, q, _jid, local_pos)
-        pos = CalcBodyToBaseCoordinates(*input)
-        
+        pos = self._fk(_jid, q, local_pos)
+
         _rid = obj.parent_joint
         # rpy = np.array(self.rpys[_rid]) 
         # qua = p.getQuaternionFromEuler(rpy)
@@ -354,12 +481,7 @@ class ObdlRender():
         return pos,qua
     
     def get_poslist(self):
-        _res = []
-        for _obj in self.render_objects:
-            _res.append(_obj.position)
-        n = len(_res)
-        _res = np.reshape(np.asarray(_res),(n,3))
-        return _res
+        return np.array(self.positions)
     
     def check_collision(self,contact_ids):
         self.p.stepSimulation() # for collision  detect
@@ -24,6 +24,125 @@ from envs.core import Env
 from utils import Random
 import numpy.random as npr
 
+
+@jax.jit
+def _policy_fn(params, state):
+    """
+    MLP forward pass for the actor, jitted once at module level so XLA
+    fuses the matmul+bias+relu chain instead of dispatching per layer.
+    """
+    # run in the params' dtype (fp32 or bf16), hand back fp32 logits
+    activations = state.astype(params[0][0].dtype)
+    for w, b in params[:-1]:
+        outputs = jnp.dot(activations, w) + b
+        # activations = jnp.tanh(outputs)
+        activations = jax.nn.relu(outputs)
+    final_w, final_b = params[-1]
+    logits = jnp.dot(activations, final_w) + final_b
+    return logits.astype(jnp.float32)
+
+
+@jax.jit
+def _policy3_fn(state, w1, b1, w2, b2, w3, b3):
+    """
+    Actor forward pass specialized for the fixed
+    [env_state_size, 128, 128, |A|] shape: the layer tensors are
+    plain positional args, so there is no Python loop or pytree
+    traversal per call and XLA sees one straight-line graph.
+    """
+    h = jax.nn.relu(jnp.dot(state.astype(w1.dtype), w1) + b1)
+    h = jax.nn.relu(jnp.dot(h, w2) + b2)
+    return (jnp.dot(h, w3) + b3).astype(jnp.float32)
+
+
+def _policy_sum(state, params):
+    return jnp.sum(_policy_fn(params, state))
+
+
+# gradient of the policy output wrt params as a pure function of
+# (state, params): __call__ mutates self.state/self.action, so taking
+# jax.grad of the bound method kept re-tracing instead of hitting the
+# jit cache
+_d_policy_d_params = jax.jit(jax.grad(_policy_sum, argnums=1))
+
+
+def _log_prob(logits, action):
+    return jax.nn.log_softmax(logits)[action]
+
+
+# gradient of the action log-prob wrt logits, O(|A|) via reverse-mode AD
+# instead of materializing the |A|x|A| softmax Jacobian
+_dlog_prob = jax.jit(jax.grad(_log_prob, argnums=0))
+
+
+@jax.jit
+def _discounted_returns(rewards, gamma):
+    """
+    Discounted returns R_t = sum_k gamma^k r_{t+k} for the whole episode
+    in one associative scan: the linear recurrence is carried as
+    (value, decay) pairs so the combine op is associative and runs in
+    O(log T) parallel depth instead of a serial Python loop.
+    """
+    decays = jnp.full_like(rewards, gamma)
+
+    def op(x, y):
+        vx, dx = x
+        vy, dy = y
+        return (vx + dx * vy, dx * dy)
+
+    returns, _ = jax.lax.associative_scan(op, (rewards, decays), reverse=True)
+    return returns
+
+
+@jax.jit
+def _update_fn(params, grads, lr):
+    """
+    Gradient-clipped SGD step as one fused pytree op, so the norm,
+    scale and parameter update run on device without per-layer
+    host syncs.
+    """
+    #get norm square
+    total_norm_sqr = sum(jnp.vdot(g, g) for g in jax.tree_util.tree_leaves(grads))
+
+    #scale the gradient
+    gradient_clip = 0.2
+    scale = jnp.minimum(1.0, gradient_clip / (total_norm_sqr**0.5 + 1e-4))
+
+    return jax.tree_util.tree_map(lambda p, g: p - lr * scale * g, params, grads)
+
+
+@jax.jit
+def _value_fn(params, state):
+    """
+    MLP forward pass for the critic, jitted once at module level.
+    The critic is always [env_state_size, 128, 128, 1], so the two
+    hidden layers are unrolled by hand to give XLA one straight-line
+    matmul->bias->tanh graph to fuse.
+    """
+    h = jnp.tanh(jnp.dot(state.astype(params[0][0].dtype), params[0][0]) + params[0][1])
+    h = jnp.tanh(jnp.dot(h, params[1][0]) + params[1][1])
+    return (jnp.dot(h, params[2][0]) + params[2][1])[0].astype(jnp.float32)
+
+
+@jax.jit
+def _train_step(params, states, actions, rewards, lr, gamma):
+    """
+    Whole policy-gradient update as one compiled graph: discounted
+    returns, batched log-prob gradients over the episode, and the
+    clipped SGD step all run in a single XLA launch instead of T
+    Python-driven feed() calls plus a separate update().
+    """
+    returns = _discounted_returns(rewards, gamma)
+
+    def loss(p):
+        logits = jax.vmap(_policy_fn, in_axes=(None, 0))(p, states)
+        logp = jax.vmap(lambda l, a: jax.nn.log_softmax(l)[a])(logits, actions)
+        return -jnp.mean(logp * returns)
+
+    grads = jax.grad(loss)(params)
+    return _update_fn(params, grads, lr)
+
+
 # generic deep controller for 1-dimensional discrete non-negative action space
 class Deep_Arm_rbdl(Agent):
     """
@@ -39,6 +158,7 @@ class Deep_Arm_rbdl(Agent):
         gamma: Real = 0.99,
         max_episode_length: int = 500,
         seed: int = 0,
+        dtype=jnp.float32,
     ) -> None:
         """
         Description: initializes the Deep agent
@@ -49,6 +169,7 @@ class Deep_Arm_rbdl(Agent):
             gamma (Real):
             max_episode_length (int):
             seed (int):
+            dtype: param dtype, jnp.bfloat16 halves the bytes moved per step
 
         Returns:
             None
@@ -59,10 +180,21 @@ class Deep_Arm_rbdl(Agent):
         self.max_episode_length = max_episode_length
         self.lr = learning_rate
         self.gamma = gamma
+        self.dtype = dtype
 
         self.random = Random(seed)
 
-        self.d_a_d_w = jax.grad(self.__call__,argnums=1)
+        self.d_a_d_w = _d_policy_d_params
+
+        # batched entry points: stack N env states into (N, env_state_size)
+        # and evaluate them with one fused kernel instead of N dispatches
+        self.batched_policy = jax.jit(jax.vmap(_policy_fn, in_axes=(None, 0)))
+        self.batched_value = jax.jit(jax.vmap(_value_fn, in_axes=(None, 0)))
+        if jax.device_count() > 1:
+            # multi-device variant under its own name: callers shard the
+            # batch to (n_devices, N/n_devices, env_state_size) first
+            self.pmapped_policy = jax.pmap(jax.vmap(_policy_fn, in_axes=(None, 0)), in_axes=(None, 0))
+            self.pmapped_value = jax.pmap(jax.vmap(_value_fn, in_axes=(None, 0)), in_axes=(None, 0))
         self.reset()
         self.value_losses = []
 
@@ -76,9 +208,10 @@ class Deep_Arm_rbdl(Agent):
         Returns:
             None
         """
-        # Init weight
+        # Init weight, converted to device arrays once here so policy/value
+        # don't re-copy the numpy weights host->device on every call
         def init_random_params(scale, layer_sizes, rng=npr.RandomState(0)):
-            return [(scale * rng.randn(m, n), scale * rng.randn(n))
+            return [(jnp.asarray(scale * rng.randn(m, n)), jnp.asarray(scale * rng.randn(n)))
                 for m, n, in zip(layer_sizes[:-1], layer_sizes[1:])]
 
         layer_sizes = [self.env_state_size, 128, 128, len(self.action_space)]
@@ -87,6 +220,10 @@ class Deep_Arm_rbdl(Agent):
         #critic weights
         critic_layer_sizes = [self.env_state_size, 128, 128, 1]
         self.value_params =  init_random_params(param_scale, critic_layer_sizes)
+        if self.dtype != jnp.float32:
+            # e.g. bfloat16: halves param/activation memory traffic
+            self.params = jax.tree_util.tree_map(lambda x: x.astype(self.dtype), self.params)
+            self.value_params = jax.tree_util.tree_map(lambda x: x.astype(self.dtype), self.value_params)
 
         self.W = jax.random.uniform(
             self.random.generate_key(),
@@ -106,8 +243,18 @@ class Deep_Arm_rbdl(Agent):
         # dummy values for attrs, needed to inform scan of traced shapes
         self.state = jnp.zeros((self.env_state_size,))
         self.action = self.action_space[0]
-        ones = jnp.ones((len(self.action_space),))
-        self.probs = ones * 1/jnp.sum(ones)
+        self.logits = jnp.zeros((len(self.action_space),))
+
+        self.refresh_flat_params()
+
+    def refresh_flat_params(self) -> None:
+        """
+        Description: re-flatten self.params for the specialized policy
+
+        Call after reassigning self.params so callers of the flat
+        entry point see the new weights.
+        """
+        self._flat_params = tuple(t for layer in self.params for t in layer)
 
 
 
@@ -119,43 +266,17 @@ class Deep_Arm_rbdl(Agent):
             state (jnp.ndarray):
             w (jnp.ndarray):
         """
-        activations = state
-        for w, b in params[:-1]:
-            outputs = jnp.dot(activations, w) + b
-            # activations = jnp.tanh(outputs)
-            activations = jax.nn.relu(outputs)
-        final_w, final_b = params[-1]
-        logits = jnp.dot(activations, final_w) + final_b
-        # print("logits",logits)
-
         # z = jnp.dot(state, w)
         # exp = jnp.exp(z)
-        # exp = jnp.exp(logits)
         # return exp / jnp.sum(exp)
-        return logits
+        return _policy_fn(params, state)
 
     def value(self, state, params):
         """
         estimate the value of state
         """
-        # state = state.flatten() 
-        activations = state
-        for w, b in params[:-1]:
-            outputs = jnp.dot(activations, w) + b
-            activations = jnp.tanh(outputs)
-        final_w, final_b = params[-1]
-        logits = jnp.dot(activations, final_w) + final_b
-        return logits[0]
-
-    def softmax_grad(self, softmax: jnp.ndarray) -> jnp.ndarray:
-        """
-        Description: Vectorized softmax Jacobian
-
-        Args:
-            softmax (jnp.ndarray)
-        """
-        s = softmax.reshape(-1, 1)
-        return jnp.diagflat(s) - jnp.dot(s, s.T)
+        # state = state.flatten()
+        return _value_fn(params, state)
 
     def __call__(self, state: jnp.ndarray, params):
         """
@@ -170,9 +291,11 @@ class Deep_Arm_rbdl(Agent):
         # print("state",state)
         # print("W",self.W)
         self.state = state
-        # self.probs = self.policy(state, params)
-        # state = state.flatten() 
-        self.action = self.policy(state, params)         
+        # state = state.flatten()
+        # unpack the 3 fixed layers so the specialized kernel is used
+        (w1, b1), (w2, b2), (w3, b3) = params
+        self.logits = _policy3_fn(state, w1, b1, w2, b2, w3, b3)
+        self.action = self.logits
         # self.action = jax.random.choice(
         #     self.random.generate_key(), 
         #     a=self.action_space, 
@@ -192,38 +315,40 @@ class Deep_Arm_rbdl(Agent):
         Returns:
             None
         """
-        dsoftmax = self.softmax_grad(self.probs)[self.action, :]
-        dlog = dsoftmax / self.probs[self.action]
-        grad = self.state.reshape(-1, 1) @ dlog.reshape(1, -1)
+        dlog = _dlog_prob(self.logits, self.action)
+        grad = jnp.outer(self.state, dlog)
 
-        self.episode_rewards = jax.ops.index_update(
-            self.episode_rewards, self.current_episode_length, reward
-        )
-        self.episode_grads = jax.ops.index_update(
-            self.episode_grads, self.current_episode_length, grad
-        )
+        self.episode_rewards = self.episode_rewards.at[self.current_episode_length].set(reward)
+        self.episode_grads = self.episode_grads.at[self.current_episode_length].set(grad)
         self.current_episode_length += 1
 
+    def discounted_returns(self):
+        """
+        Description: discounted returns over the recorded episode
+
+        Entries past current_episode_length are zero in the reward
+        buffer, so they don't perturb the earlier returns.
+        """
+        return _discounted_returns(self.episode_rewards, self.gamma)
+
     def update(self, grads, params, lr):
         """
         Description: update weights
         """
-        #get norm square
-        total_norm_sqr = 0                
-        for (dw,db) in grads:
-            # print("previous dw",dw)
-            # dw = normalize(dw)
-            # db = normalize(db[:,np.newaxis],axis =0).ravel()
-            total_norm_sqr += np.linalg.norm(dw) ** 2
-            total_norm_sqr += np.linalg.norm(db) ** 2
-        # print("grads",grads)
-
-        #scale the gradient
-        gradient_clip = 0.2
-        scale = min(
-            1.0, gradient_clip / (total_norm_sqr**0.5 + 1e-4))
-
-        params = [(w - lr * scale * dw, b - lr * scale * db)
-                for (w, b), (dw, db) in zip(params, grads)]
-
-        return params
+        return _update_fn(params, grads, lr)
+
+    def train_step(self, states, actions, rewards):
+        """
+        Description: one policy-gradient update over a whole episode
+
+        Args:
+            states (jnp.ndarray): (T, env_state_size)
+            actions (jnp.ndarray): (T,) int action indices
+            rewards (jnp.ndarray): (T,)
+
+        Returns:
+            updated policy params (also stored on the agent)
+        """
+        self.params = _train_step(self.params, states, actions, rewards, self.lr, self.gamma)
+        self.refresh_flat_params()
+        return self.params